@@ -0,0 +1,117 @@
+"""Numeric core of the fraud feature engine.
+
+Pure scalar math on primitive floats so it can be compiled with Numba.
+When Numba is not installed the functions run as plain Python.
+"""
+
+from __future__ import annotations
+
+from math import acos, cos, exp, fabs
+from typing import Tuple
+
+try:
+    from numba import njit  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+
+    def njit(*args, **kwargs):  # type: ignore
+        """No-op stand-in for numba.njit."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+
+EPSILON = 1e-9
+EARTH_RADIUS_KM = 6371.0
+
+
+@njit(cache=True)
+def _sigmoid(x: float) -> float:
+    """Normalize score with logistic function: 1 / (1 + exp(-x))."""
+    return 1.0 / (1.0 + exp(-x))
+
+
+@njit(cache=True)
+def _sigmoid_fast(x: float) -> float:
+    """Algebraic sigmoid 0.5 + 0.5 * x / (1 + |x|).
+
+    Monotone, maps to (0, 1) with f(0) = 0.5 like _sigmoid, but needs a single
+    divide instead of exp and cannot overflow. Used for all score normalization.
+    """
+    return 0.5 + 0.5 * x / (1.0 + fabs(x))
+
+
+@njit(cache=True)
+def _haversine_km_precomp(
+    r_lat1: float, r_lon1: float, cos_lat1: float, r_lat2: float, r_lon2: float, cos_lat2: float
+) -> float:
+    """Great-circle distance in kilometers from points already in radians.
+
+    Callers keep radians(lat), radians(lon) and cos(lat) per point so each
+    location is converted once. Uses the cosine form of the haversine, which
+    needs one acos instead of two sin², a sqrt and an asin:
+
+    distance_km = R * acos(cos(lat2 - lat1) - cos(lat1) * cos(lat2) * (1 - cos(lon2 - lon1)))
+    """
+    c = cos(r_lat2 - r_lat1) - cos_lat1 * cos_lat2 * (1.0 - cos(r_lon2 - r_lon1))
+    return EARTH_RADIUS_KM * acos(min(1.0, max(-1.0, c)))
+
+
+@njit(cache=True)
+def _score(
+    amount: float,
+    mu: float,
+    sigma: float,
+    n_w: float,
+    lambda_u: float,
+    sigma_lambda: float,
+    has_prev: bool,
+    r_lat1: float,
+    r_lon1: float,
+    cos_lat1: float,
+    r_lat2: float,
+    r_lon2: float,
+    cos_lat2: float,
+    delta_hours: float,
+    asn_changed: float,
+    geo_std: float,
+) -> Tuple[float, float, float, float, float]:
+    """Compute the four normalized scores from gathered user statistics.
+
+    Locations are given as (radians(lat), radians(lon), cos(lat)); point 1 is
+    the previous location and is only used when has_prev is set.
+
+    Returns (S_spend_norm, S_velocity_norm, S_geo_norm, Risk_final, distance_km).
+    """
+    # S_spend_norm = sigmoid(|A_t − μ_u| / (σ_u + ε)), fused into one expression.
+    s_spend_norm = _sigmoid_fast(fabs(amount - mu) / (sigma + EPSILON))
+
+    # S_velocity = (N_w − λ_u) / (σ_λ + ε)
+    s_velocity = (n_w - lambda_u) / (sigma_lambda + EPSILON)
+    s_velocity_norm = _sigmoid_fast(s_velocity)
+
+    if has_prev:
+        distance_km = _haversine_km_precomp(r_lat1, r_lon1, cos_lat1, r_lat2, r_lon2, cos_lat2)
+
+        # S_speed = min(1, v / 900) with v = distance_km / delta_hours
+        v = distance_km / max(delta_hours, EPSILON)
+        s_speed = min(1.0, v / 900.0)
+
+        # S_hist = distance_km / (geo_std + ε)
+        s_hist = distance_km / (geo_std + EPSILON)
+        s_asn = asn_changed
+    else:
+        # No prior geo context for first transaction.
+        distance_km = 0.0
+        s_speed = 0.0
+        s_hist = 0.0
+        s_asn = 0.0
+
+    # S_geo = 0.5*S_speed + 0.3*S_hist + 0.2*S_asn
+    s_geo = 0.5 * s_speed + 0.3 * s_hist + 0.2 * s_asn
+    s_geo_norm = _sigmoid_fast(s_geo)
+
+    # Risk_raw = 0.4*S_spend_norm + 0.3*S_velocity_norm + 0.3*S_geo_norm
+    risk_raw = 0.4 * s_spend_norm + 0.3 * s_velocity_norm + 0.3 * s_geo_norm
+    risk_final = _sigmoid_fast(risk_raw)
+
+    return s_spend_norm, s_velocity_norm, s_geo_norm, risk_final, distance_km
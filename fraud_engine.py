@@ -6,46 +6,76 @@ Implements the exact formulas requested for:
 3) IP-based geo anomaly score
 4) Final fraud risk score
 
+Scores are normalized with a fast algebraic sigmoid rather than the logistic
+function; both are monotone with the same (0, 1) range and midpoint.
+
 This module maintains per-user historical state in memory for demonstration.
 """
 
 from __future__ import annotations
 
+import os
+from array import array
+from bisect import bisect_left, bisect_right, insort
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from math import asin, cos, exp, radians, sin, sqrt
-from statistics import mean, pstdev
+from datetime import datetime, timezone
+from functools import lru_cache
+from math import cos, radians, sqrt
 from typing import Dict, List, Optional, Tuple
 
+from _fraud_core import EPSILON, _score
+
 try:
     import maxminddb  # type: ignore
 except Exception:  # pragma: no cover - optional dependency
     maxminddb = None
 
 
-EPSILON = 1e-9
-EARTH_RADIUS_KM = 6371.0
+# Max distinct IPs kept in the per-engine geo lookup cache.
+IP_GEO_CACHE_SIZE = 100_000
+
+# How far (seconds) an event may arrive behind a user's newest one and still
+# see an exact 1-hour window. Later events count only retained entries.
+MAX_LATENESS_S = 24 * 3600
 
 
-@dataclass
+@dataclass(slots=True)
 class UserState:
     """Per-user state needed for rolling fraud features."""
 
-    # Historical amounts for rolling mean/std.
-    amounts: List[float] = field(default_factory=list)
+    # Welford running count/mean/M2 of amounts for rolling mean/std.
+    amt_n: int = 0
+    amt_mean: float = 0.0
+    amt_m2: float = 0.0
 
-    # Historical timestamps for transaction frequency and hourly history.
-    timestamps: List[datetime] = field(default_factory=list)
+    # Epoch seconds from the last hour plus MAX_LATENESS_S, sorted, for
+    # transaction frequency; stored unboxed as int64.
+    recent_ts: array = field(default_factory=lambda: array("q"))
+
+    # Per-hour transaction counts (keyed by hour start, see _parse_iso) with
+    # running sums for O(1) mean/std.
+    hour_counts: Counter = field(default_factory=Counter)
+    hour_sum: int = 0
+    hour_sumsq: int = 0
+    num_buckets: int = 0
 
     # Last known network identity and time.
     last_lat: Optional[float] = None
     last_lon: Optional[float] = None
-    last_asn: Optional[str] = None
-    last_timestamp: Optional[datetime] = None
+    # radians(last_lat), radians(last_lon), cos(last_lat) for the haversine.
+    last_lat_rad: float = 0.0
+    last_lon_rad: float = 0.0
+    last_cos_lat: float = 1.0
+    # Interned ASN id (see FraudFeatureEngine._asn_id); -1 before the first transaction.
+    last_asn_id: int = -1
+    last_timestamp: Optional[int] = None
 
-    # Historical geo movement distances (km) for geo std.
-    geo_distances: List[float] = field(default_factory=list)
+    # Welford running count/mean/M2 of geo distances for geo std.
+    geo_n: int = 0
+    geo_mean: float = 0.0
+    geo_m2: float = 0.0
 
 
 class FraudFeatureEngine:
@@ -56,11 +86,7 @@ class FraudFeatureEngine:
 
         self.city_reader = None
         self.asn_reader = None
-
-        if geolite2_city_db_path and maxminddb:
-            self.city_reader = maxminddb.open_database(geolite2_city_db_path)
-        if geolite2_asn_db_path and maxminddb:
-            self.asn_reader = maxminddb.open_database(geolite2_asn_db_path)
+        self.load_geolite2(geolite2_city_db_path, geolite2_asn_db_path)
 
         # Deterministic fallback map for demo when MaxMind DBs are unavailable.
         self.fallback_geo = {
@@ -71,39 +97,63 @@ class FraudFeatureEngine:
             "185.199.108.153": (51.5074, -0.1278, "AS54113"),
         }
 
-    @staticmethod
-    def _sigmoid(x: float) -> float:
-        """Normalize score with logistic function: 1 / (1 + exp(-x))."""
-        return 1.0 / (1.0 + exp(-x))
+        # ASN string -> small int id, so ASN change checks compare ints.
+        self._asn_ids: Dict[str, int] = {}
 
-    @staticmethod
-    def _parse_iso(ts: str) -> datetime:
-        """Parse ISO timestamp into datetime."""
-        return datetime.fromisoformat(ts)
+    def load_geolite2(self, city_db_path: Optional[str] = None, asn_db_path: Optional[str] = None) -> None:
+        """(Re)open the GeoLite2 readers and reset the IP lookup cache."""
+        self.city_reader = None
+        self.asn_reader = None
+
+        if city_db_path and maxminddb:
+            self.city_reader = self._open_mmdb(city_db_path)
+        if asn_db_path and maxminddb:
+            self.asn_reader = self._open_mmdb(asn_db_path)
+
+        # Repeated IPs are the common case, so memoize lookups per reader set.
+        # Call self._lookup_ip_geo.cache_clear() after editing fallback_geo.
+        self._lookup_ip_geo = lru_cache(maxsize=IP_GEO_CACHE_SIZE)(self._resolve_ip_geo)
 
     @staticmethod
-    def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Haversine distance in kilometers.
-
-        distance_km = 2 * R * asin(
-            sqrt(
-                sin²((lat2 - lat1)/2) +
-                cos(lat1) * cos(lat2) * sin²((lon2 - lon1)/2)
-            )
-        )
+    def _open_mmdb(path: str):
+        """Open a MaxMind DB via the C extension (mmap), else pure-Python mmap.
+
+        The fast path needs maxminddb's C extension (built against libmaxminddb).
+        Both modes share pages through the OS, so score_stream workers do not
+        each hold a private copy of the database.
         """
-        d_lat = radians(lat2 - lat1)
-        d_lon = radians(lon2 - lon1)
-        r_lat1 = radians(lat1)
-        r_lat2 = radians(lat2)
+        try:
+            return maxminddb.open_database(path, mode=maxminddb.MODE_MMAP_EXT)
+        except ValueError:
+            return maxminddb.open_database(path, mode=maxminddb.MODE_MMAP)
 
-        a = sin(d_lat / 2) ** 2 + cos(r_lat1) * cos(r_lat2) * sin(d_lon / 2) ** 2
-        return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+    @staticmethod
+    def _parse_iso(ts: str) -> Tuple[int, int]:
+        """Parse ISO timestamp into (epoch seconds, epoch start of its local hour).
 
-    def _lookup_ip_geo(self, ip_address: str) -> Tuple[float, float, str]:
-        """Resolve IP to (lat, lon, ASN).
+        Naive timestamps are read as UTC. The hour key follows the timestamp's
+        own wall clock, so offsets like +05:30 bucket by local hour.
+        """
+        dt = datetime.fromisoformat(ts)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        epoch = int(dt.timestamp())
+        offset = int(dt.utcoffset().total_seconds())
+        return epoch, (epoch + offset) // 3600 * 3600 - offset
+
+    def _asn_id(self, asn: str) -> int:
+        """Intern an ASN string as a small integer id."""
+        i = self._asn_ids.get(asn)
+        if i is None:
+            i = self._asn_ids[asn] = len(self._asn_ids)
+        return i
+
+    def _resolve_ip_geo(self, ip_address: str) -> Tuple[float, float, int]:
+        """Resolve IP to (lat, lon, interned ASN id).
 
         Uses GeoLite2 readers if configured; otherwise uses deterministic fallback.
+        Callers go through the cached self._lookup_ip_geo set up in load_geolite2,
+        so each IP's ASN is interned once.
         """
         if self.city_reader and self.asn_reader:
             city_data = self.city_reader.get(ip_address) or {}
@@ -114,21 +164,14 @@ class FraudFeatureEngine:
             asn_org = asn_data.get("autonomous_system_organization") or asn_data.get("autonomous_system_number")
 
             if lat is not None and lon is not None and asn_org is not None:
-                return float(lat), float(lon), str(asn_org)
+                return float(lat), float(lon), self._asn_id(str(asn_org))
 
         if ip_address in self.fallback_geo:
-            return self.fallback_geo[ip_address]
+            lat, lon, asn = self.fallback_geo[ip_address]
+            return lat, lon, self._asn_id(asn)
 
         # Stable default for unknown IPs in demo mode.
-        return 0.0, 0.0, "ASN_UNKNOWN"
-
-    @staticmethod
-    def _hourly_counts(timestamps: List[datetime]) -> List[int]:
-        """Build historical per-hour transaction count series from timestamps."""
-        if not timestamps:
-            return []
-        c = Counter(ts.replace(minute=0, second=0, microsecond=0) for ts in timestamps)
-        return list(c.values())
+        return 0.0, 0.0, self._asn_id("ASN_UNKNOWN")
 
     def compute_fraud_features(self, transaction: Dict[str, object]) -> Dict[str, float]:
         """Compute fraud features and update user state.
@@ -150,110 +193,133 @@ class FraudFeatureEngine:
           }
         """
         user_id = str(transaction["user_id"])
-        ts = self._parse_iso(str(transaction["timestamp"]))
+        ts, hour = self._parse_iso(str(transaction["timestamp"]))
         amount = float(transaction["amount"])
         ip_address = str(transaction["ip_address"])
 
-        state = self.user_state[user_id]
+        # Step 1 of the geo score: IP -> (latitude, longitude, ASN id)
+        lat_cur, lon_cur, asn_cur = self._lookup_ip_geo(ip_address)
 
+        return self._score_transaction(self.user_state[user_id], ts, hour, amount, lat_cur, lon_cur, asn_cur)
+
+    def _score_transaction(
+        self,
+        state: UserState,
+        ts: int,
+        hour: int,
+        amount: float,
+        lat_cur: float,
+        lon_cur: float,
+        asn_cur: int,
+    ) -> Dict[str, float]:
+        """Score one resolved transaction against user state, then update it.
+
+        hour is the hour key from _parse_iso and asn_cur the interned id from
+        _asn_id. The numeric work is done by the _fraud_core._score kernel.
+        """
         # ----------------------------------------
         # 1) SPENDING DEVIATION SCORE
         # ----------------------------------------
         # μ_u = rolling mean of historical transaction amounts
         # σ_u = rolling std deviation of historical amounts
-        historical_amounts = state.amounts
-        if historical_amounts:
-            mu_u = mean(historical_amounts)
-            sigma_u = pstdev(historical_amounts) if len(historical_amounts) > 1 else 0.0
+        if state.amt_n:
+            mu_u = state.amt_mean
+            sigma_u = sqrt(state.amt_m2 / state.amt_n) if state.amt_n > 1 else 0.0
         else:
             mu_u = amount
             sigma_u = 0.0
 
-        # S_spend = |A_t − μ_u| / (σ_u + ε)
-        s_spend = abs(amount - mu_u) / (sigma_u + EPSILON)
-
-        # S_spend_norm = 1 / (1 + exp(-S_spend))
-        s_spend_norm = self._sigmoid(s_spend)
-
         # ----------------------------------------
         # 2) VELOCITY SCORE
         # ----------------------------------------
         # N_w = number of transactions in the last 1 hour
-        one_hour_ago = ts - timedelta(hours=1)
-        n_w = sum(1 for hts in state.timestamps if one_hour_ago <= hts <= ts) + 1
+        # The window is kept sorted, so late events count only entries in
+        # [ts - 1h, ts]. Entries are kept back to newest - 1h - MAX_LATENESS_S,
+        # so events up to MAX_LATENESS_S late count the same as in full history.
+        recent_ts = state.recent_ts
+        n_w = bisect_right(recent_ts, ts) - bisect_left(recent_ts, ts - 3600) + 1
+        newest = max(ts, recent_ts[-1]) if recent_ts else ts
+        expired = bisect_left(recent_ts, newest - 3600 - MAX_LATENESS_S)
+        if expired:
+            del recent_ts[:expired]
 
         # λ_u = historical average transactions per hour
-        # σ_λ = std deviation of hourly frequency
-        hourly_counts = self._hourly_counts(state.timestamps)
-        if hourly_counts:
-            lambda_u = mean(hourly_counts)
-            sigma_lambda = pstdev(hourly_counts) if len(hourly_counts) > 1 else 0.0
+        # σ_λ = std deviation of hourly frequency, via σ² = E[x²] − E[x]²
+        if state.num_buckets:
+            lambda_u = state.hour_sum / state.num_buckets
+            var_lambda = state.hour_sumsq / state.num_buckets - lambda_u ** 2
+            sigma_lambda = sqrt(max(var_lambda, 0.0))
         else:
             lambda_u = 0.0
             sigma_lambda = 0.0
 
-        # S_velocity = (N_w − λ_u) / (σ_λ + ε)
-        s_velocity = (n_w - lambda_u) / (sigma_lambda + EPSILON)
-
-        # S_velocity_norm = 1 / (1 + exp(-S_velocity))
-        s_velocity_norm = self._sigmoid(s_velocity)
-
         # ----------------------------------------
         # 3) IP-BASED GEO ANOMALY SCORE
         # ----------------------------------------
-        # Step 1: IP -> (latitude, longitude, ASN)
-        lat_cur, lon_cur, asn_cur = self._lookup_ip_geo(ip_address)
-
-        if state.last_lat is not None and state.last_lon is not None and state.last_timestamp is not None:
-            # Step 2: Haversine distance from last known IP location.
-            distance_km = self._haversine_km(state.last_lat, state.last_lon, lat_cur, lon_cur)
-
-            # Step 3: Travel speed v = distance_km / delta_hours
-            delta_hours = max((ts - state.last_timestamp).total_seconds() / 3600.0, EPSILON)
-            v = distance_km / delta_hours
-
-            # Step 4: Speed anomaly S_speed = min(1, v / 900)
-            s_speed = min(1.0, v / 900.0)
-
-            # Step 5: ASN change S_asn
-            s_asn = 1.0 if asn_cur != state.last_asn else 0.0
-
-            # Step 6: Historical geo deviation S_hist = distance_km / (geo_std + ε)
-            geo_std = pstdev(state.geo_distances) if len(state.geo_distances) > 1 else 0.0
-            s_hist = distance_km / (geo_std + EPSILON)
+        has_prev = state.last_lat is not None and state.last_lon is not None and state.last_timestamp is not None
+        if has_prev:
+            # Travel time since last transaction, ASN change and historical geo std.
+            delta_hours = (ts - state.last_timestamp) / 3600.0
+            asn_changed = (asn_cur != state.last_asn_id) * 1.0
+            geo_std = sqrt(state.geo_m2 / state.geo_n) if state.geo_n > 1 else 0.0
         else:
-            # No prior geo context for first transaction.
-            distance_km = 0.0
-            s_speed = 0.0
-            s_asn = 0.0
-            s_hist = 0.0
-
-        # Final geo score: S_geo = 0.5*S_speed + 0.3*S_hist + 0.2*S_asn
-        s_geo = 0.5 * s_speed + 0.3 * s_hist + 0.2 * s_asn
+            delta_hours = asn_changed = geo_std = 0.0
 
-        # S_geo_norm = 1 / (1 + exp(-S_geo))
-        s_geo_norm = self._sigmoid(s_geo)
+        # Convert the new point once; it is stored below for the next event.
+        r_lat_cur = radians(lat_cur)
+        r_lon_cur = radians(lon_cur)
+        cos_lat_cur = cos(r_lat_cur)
 
         # ----------------------------------------
         # 4) FINAL FRAUD RISK SCORE
         # ----------------------------------------
-        # Risk_raw = 0.4*S_spend_norm + 0.3*S_velocity_norm + 0.3*S_geo_norm
-        risk_raw = 0.4 * s_spend_norm + 0.3 * s_velocity_norm + 0.3 * s_geo_norm
-
-        # Risk_final = 1 / (1 + exp(-Risk_raw))
-        risk_final = self._sigmoid(risk_raw)
+        s_spend_norm, s_velocity_norm, s_geo_norm, risk_final, distance_km = _score(
+            amount,
+            mu_u,
+            sigma_u,
+            float(n_w),
+            lambda_u,
+            sigma_lambda,
+            has_prev,
+            state.last_lat_rad,
+            state.last_lon_rad,
+            state.last_cos_lat,
+            r_lat_cur,
+            r_lon_cur,
+            cos_lat_cur,
+            delta_hours,
+            asn_changed,
+            geo_std,
+        )
 
         # Update per-user state AFTER feature computation to preserve "historical" semantics.
-        state.amounts.append(amount)
-        state.timestamps.append(ts)
+        state.amt_n += 1
+        delta = amount - state.amt_mean
+        state.amt_mean += delta / state.amt_n
+        state.amt_m2 += delta * (amount - state.amt_mean)
+        insort(state.recent_ts, ts)
+
+        # Bump the hourly bucket: (c + 1)² − c² = 2c + 1.
+        old_count = state.hour_counts[hour]
+        if not old_count:
+            state.num_buckets += 1
+        state.hour_counts[hour] = old_count + 1
+        state.hour_sum += 1
+        state.hour_sumsq += 2 * old_count + 1
 
         if state.last_lat is not None and state.last_lon is not None:
-            # Keep step distances to compute rolling geo std for future events.
-            state.geo_distances.append(distance_km)
+            # Fold step distance into the rolling geo std for future events.
+            state.geo_n += 1
+            delta = distance_km - state.geo_mean
+            state.geo_mean += delta / state.geo_n
+            state.geo_m2 += delta * (distance_km - state.geo_mean)
 
         state.last_lat = lat_cur
         state.last_lon = lon_cur
-        state.last_asn = asn_cur
+        state.last_lat_rad = r_lat_cur
+        state.last_lon_rad = r_lon_cur
+        state.last_cos_lat = cos_lat_cur
+        state.last_asn_id = asn_cur
         state.last_timestamp = ts
 
         return {
@@ -273,6 +339,48 @@ def compute_fraud_features(transaction: Dict[str, object]) -> Dict[str, float]:
     return ENGINE.compute_fraud_features(transaction)
 
 
+def _score_shard(
+    shard: List[Dict[str, object]], geolite2_city_db_path: Optional[str], geolite2_asn_db_path: Optional[str]
+) -> List[Dict[str, float]]:
+    """Score one shard with a fresh engine (runs inside a worker process)."""
+    engine = FraudFeatureEngine(geolite2_city_db_path, geolite2_asn_db_path)
+    return [engine.compute_fraud_features(tx) for tx in shard]
+
+
+def score_stream(
+    transactions: List[Dict[str, object]],
+    workers: Optional[int] = None,
+    geolite2_city_db_path: Optional[str] = None,
+    geolite2_asn_db_path: Optional[str] = None,
+) -> List[Dict[str, float]]:
+    """Score a finished transaction stream (e.g. a backfill) across processes.
+
+    State is per user, so transactions are sharded by hash(user_id) % workers
+    and each shard is scored from empty state by its own engine; no state is
+    shared between shards or with the global ENGINE. Results come back in
+    input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return _score_shard(transactions, geolite2_city_db_path, geolite2_asn_db_path)
+
+    shard_idx: List[List[int]] = [[] for _ in range(workers)]
+    for i, tx in enumerate(transactions):
+        shard_idx[hash(str(tx["user_id"])) % workers].append(i)
+
+    results: List[Dict[str, float]] = [{} for _ in transactions]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (idx, pool.submit(_score_shard, [transactions[i] for i in idx], geolite2_city_db_path, geolite2_asn_db_path))
+            for idx in shard_idx
+            if idx
+        ]
+        for idx, future in futures:
+            for i, scores in zip(idx, future.result()):
+                results[i] = scores
+    return results
+
+
 def _demo_transactions() -> List[Dict[str, object]]:
     """Example test transactions for demonstration."""
     return [
@@ -0,0 +1,152 @@
+"""Tests for the fraud feature engine."""
+
+from __future__ import annotations
+
+import random
+import unittest
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from _fraud_core import _sigmoid, _sigmoid_fast
+from fraud_engine import FraudFeatureEngine, score_stream
+
+
+def _random_transactions(n: int, users: int, seed: int = 0) -> List[Dict[str, object]]:
+    """Time-ordered random transactions over the demo fallback IPs."""
+    rnd = random.Random(seed)
+    ips = list(FraudFeatureEngine().fallback_geo) + ["10.0.0.1"]
+    ts = datetime(2026, 2, 15, 9, 0, 0)
+    txs = []
+    for i in range(n):
+        ts += timedelta(seconds=rnd.randint(0, 1800))
+        txs.append(
+            {
+                "transaction_id": f"T{i:05d}",
+                "user_id": f"u_{rnd.randrange(users)}",
+                "timestamp": ts.isoformat(),
+                "amount": round(rnd.lognormvariate(5, 1), 2),
+                "ip_address": rnd.choice(ips),
+                "device_hash": "dev_a",
+            }
+        )
+    return txs
+
+
+def _tx(user_id: str, timestamp: str, amount: float = 100.0, ip_address: str = "8.8.8.8") -> Dict[str, object]:
+    return {
+        "transaction_id": timestamp,
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "amount": amount,
+        "ip_address": ip_address,
+        "device_hash": "dev_a",
+    }
+
+
+class SigmoidTest(unittest.TestCase):
+    def test_fast_sigmoid_keeps_logistic_shape(self):
+        xs = [x / 4.0 for x in range(-200, 201)]
+        fast = [_sigmoid_fast(x) for x in xs]
+
+        self.assertEqual(_sigmoid_fast(0.0), _sigmoid(0.0))
+        self.assertEqual(fast, sorted(fast))
+        self.assertEqual(len(set(fast)), len(fast))
+        for x, y in zip(xs, fast):
+            self.assertTrue(0.0 < y < 1.0)
+            self.assertEqual(y > 0.5, _sigmoid(x) > 0.5)
+
+    def test_fast_sigmoid_does_not_overflow(self):
+        # exp(-x) overflows here in plain Python.
+        for x in (-1e308, -1e4, 1e4, 1e308):
+            self.assertTrue(0.0 <= _sigmoid_fast(x) <= 1.0)
+
+
+class VelocityWindowTest(unittest.TestCase):
+    def test_late_event_ignores_newer_transactions(self):
+        engine = FraudFeatureEngine()
+        engine.compute_fraud_features(_tx("u", "2026-02-15T09:00:00"))
+        engine.compute_fraud_features(_tx("u", "2026-02-15T09:50:00"))
+
+        # Nothing in [07:30, 08:30], so N_w = 1 against λ_u = 2, σ_λ = 0.
+        late = engine.compute_fraud_features(_tx("u", "2026-02-15T08:30:00"))
+        self.assertLess(late["velocity_score"], 0.01)
+
+        # Late inserts keep the window sorted for later bisects.
+        engine.compute_fraud_features(_tx("u", "2026-02-15T09:20:00"))
+        window = list(engine.user_state["u"].recent_ts)
+        self.assertEqual(window, sorted(window))
+
+    def test_late_event_counts_entries_older_than_newest_hour(self):
+        engine = FraudFeatureEngine()
+        engine.compute_fraud_features(_tx("u", "2026-02-15T09:00:00"))
+        engine.compute_fraud_features(_tx("u", "2026-02-15T10:30:00"))
+
+        # 09:00 is in [08:20, 09:20] though it is > 1h before 10:30, so N_w = 2
+        # against λ_u = 1, σ_λ = 0.
+        late = engine.compute_fraud_features(_tx("u", "2026-02-15T09:20:00"))
+        self.assertAlmostEqual(late["velocity_score"], 0.9999999995, places=12)
+
+    def test_window_keeps_only_lateness_horizon(self):
+        engine = FraudFeatureEngine()
+        engine.compute_fraud_features(_tx("u", "2026-02-15T09:00:00"))
+        engine.compute_fraud_features(_tx("u", "2026-02-16T09:30:00"))
+        engine.compute_fraud_features(_tx("u", "2026-02-16T10:30:00"))
+        self.assertEqual(len(engine.user_state["u"].recent_ts), 2)
+
+
+class HourBucketTest(unittest.TestCase):
+    def test_half_hour_offset_buckets_by_local_hour(self):
+        engine = FraudFeatureEngine()
+        # Same local hour, but 04:40 and 05:20 in UTC.
+        engine.compute_fraud_features(_tx("u", "2026-02-15T10:10:00+05:30"))
+        engine.compute_fraud_features(_tx("u", "2026-02-15T10:50:00+05:30"))
+        self.assertEqual(engine.user_state["u"].num_buckets, 1)
+
+    def test_late_event_joins_its_earlier_hour(self):
+        engine = FraudFeatureEngine()
+        for ts in ("2026-02-15T09:10:00", "2026-02-15T10:10:00", "2026-02-15T09:50:00"):
+            engine.compute_fraud_features(_tx("u", ts))
+        state = engine.user_state["u"]
+        self.assertEqual(state.num_buckets, 2)
+        self.assertEqual(state.hour_sumsq, 2**2 + 1**2)
+
+
+class FallbackGeoTest(unittest.TestCase):
+    def test_only_exact_fallback_ips_resolve(self):
+        engine = FraudFeatureEngine()
+        unknown = (0.0, 0.0, engine._asn_id("ASN_UNKNOWN"))
+        lat, lon, asn = engine.fallback_geo["8.8.8.8"]
+        self.assertEqual(engine._lookup_ip_geo("8.8.8.8"), (lat, lon, engine._asn_id(asn)))
+        for ip_address in ("8.8.2056", "134744072", "8.8.8.8\x00", "::1"):
+            self.assertEqual(engine._lookup_ip_geo(ip_address), unknown)
+
+    def test_fallback_edits_are_used_after_cache_clear(self):
+        engine = FraudFeatureEngine()
+        self.assertEqual(engine._lookup_ip_geo("9.9.9.9"), (0.0, 0.0, engine._asn_id("ASN_UNKNOWN")))
+
+        engine.fallback_geo["9.9.9.9"] = (47.3769, 8.5417, "AS19281")
+        engine._lookup_ip_geo.cache_clear()
+        self.assertEqual(engine._lookup_ip_geo("9.9.9.9"), (47.3769, 8.5417, engine._asn_id("AS19281")))
+
+    def test_load_geolite2_resets_lookup_cache(self):
+        engine = FraudFeatureEngine()
+        engine._lookup_ip_geo("9.9.9.9")
+        engine.fallback_geo["9.9.9.9"] = (47.3769, 8.5417, "AS19281")
+
+        engine.load_geolite2()
+        self.assertEqual(engine._lookup_ip_geo.cache_info().currsize, 0)
+        self.assertEqual(engine._lookup_ip_geo("9.9.9.9"), (47.3769, 8.5417, engine._asn_id("AS19281")))
+
+
+class ScoreStreamTest(unittest.TestCase):
+    def test_sharded_scores_match_serial(self):
+        txs = _random_transactions(2000, users=7)
+
+        serial = FraudFeatureEngine()
+        expected = [serial.compute_fraud_features(tx) for tx in txs]
+
+        self.assertEqual(score_stream(txs, workers=2), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()